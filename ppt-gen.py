@@ -1,66 +1,158 @@
-from pptx import Presentation
-from pptx.util import Inches, Pt
-from pptx.enum.text import PP_ALIGN
-from pptx.dml.color import RGBColor
 import openai
 import os
 from dotenv import load_dotenv
 import json
-import requests
-from pydub import AudioSegment
+import asyncio
+import base64
+import functools
+import hashlib
+import re
+import shutil
+import tempfile
+import httpx
+from pydantic import BaseModel, ConfigDict
+from mutagen.mp3 import MP3
 from PIL import Image, ImageDraw, ImageFont
-import cv2
-import numpy as np
-from moviepy.editor import ImageClip, AudioFileClip, concatenate_videoclips
-import pickle
+import imageio_ffmpeg
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 load_dotenv()
 
-client = openai.OpenAI(api_key=os.getenv("OPENAI_KEY"))
+client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_KEY"))
 
-LEARNING_FILE = "mermaid_patterns.pkl"
+# Upper bound on slides processed concurrently, keeps us within OpenAI/ElevenLabs RPM
+MAX_CONCURRENT_SLIDES = 5
+
+# Seconds between status checks of an OpenAI Batch job
+BATCH_POLL_INTERVAL = 15
+
+# Shared keep-alive HTTP client for ElevenLabs and Mermaid.ink, created on first use
+_http_client = None
+
+def _get_http_client():
+    global _http_client
+    if _http_client is None:
+        limits = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        _http_client = httpx.AsyncClient(
+            limits=limits,
+            transport=httpx.AsyncHTTPTransport(retries=3, limits=limits)
+        )
+    return _http_client
+
+# Rate limits and transient server errors are retried with exponential backoff
+HTTP_RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+HTTP_MAX_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 0.5
+
+def _retry_delay(response, attempt):
+    """Seconds to wait before retrying, honoring a numeric Retry-After header"""
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return HTTP_BACKOFF_FACTOR * (2 ** attempt)
+
+async def _close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+# Rendered charts keyed by a hash of their Mermaid source
+MERMAID_CACHE_DIR = ".mermaid_cache"
+_mermaid_render_cache = {}
+
+# Local mermaid-cli renders charts without a network round trip, Mermaid.ink is the fallback
+MMDC_PATH = shutil.which("mmdc")
+MMDC_TIMEOUT = 30
+
+# ffmpeg binary bundled with imageio-ffmpeg, used to encode and concatenate slide videos
+FFMPEG_PATH = imageio_ffmpeg.get_ffmpeg_exe()
+# Slides are still images, so a low frame rate and long GOP look identical but encode much faster
+VIDEO_FPS = 2
+X264_OPTIONS = ["-tune", "stillimage", "-preset", "veryfast", "-crf", "23", "-g", "600"]
+
+LEARNING_FILE = "mermaid_patterns.jsonl"
+
+# Rewrite the learning file down to the retained patterns once it grows past this size
+LEARNING_FILE_MAX_BYTES = 1024 * 1024
+
+# Parsed learning file, only re-read when its mtime changes
+_PATTERN_CACHE = {"mtime": 0, "data": None}
+
+def _learning_file_mtime():
+    try:
+        return os.path.getmtime(LEARNING_FILE)
+    except OSError:
+        return 0
 
 def load_successful_patterns():
+    mtime = _learning_file_mtime()
+    if _PATTERN_CACHE["data"] is not None and _PATTERN_CACHE["mtime"] == mtime:
+        return _PATTERN_CACHE["data"]
+    
+    successful = deque(maxlen=50)
+    failed = deque(maxlen=20)
     if os.path.exists(LEARNING_FILE):
-        try:
-            with open(LEARNING_FILE, 'rb') as f:
-                return pickle.load(f)
-        except:
-            pass
-    return {"successful_patterns": [], "failed_patterns": []}
+        with open(LEARNING_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                (successful if entry.get("success") else failed).append(entry)
+    
+    _PATTERN_CACHE["mtime"] = mtime
+    _PATTERN_CACHE["data"] = {"successful_patterns": successful, "failed_patterns": failed}
+    return _PATTERN_CACHE["data"]
 
-def save_successful_pattern(pattern, success=True):
+def _trim_learning_file():
+    """Rewrite the learning file keeping only the patterns load_successful_patterns retains"""
     data = load_successful_patterns()
+    tmp_path = LEARNING_FILE + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for entry in list(data["failed_patterns"]) + list(data["successful_patterns"]):
+            f.write(json.dumps(entry) + "\n")
+    os.replace(tmp_path, LEARNING_FILE)
+    _PATTERN_CACHE["mtime"] = _learning_file_mtime()
+
+def save_successful_pattern(pattern, success=True):
+    entry = {
+        "pattern": pattern,
+        "success": success,
+        "timestamp": datetime.now().isoformat()
+    }
+    cache_valid = _PATTERN_CACHE["data"] is not None and _PATTERN_CACHE["mtime"] == _learning_file_mtime()
     
-    if success:
-        data["successful_patterns"].append({
-            "pattern": pattern,
-            "timestamp": datetime.now().isoformat()
-        })
-        data["successful_patterns"] = data["successful_patterns"][-50:]
-    else:
-        data["failed_patterns"].append({
-            "pattern": pattern,
-            "timestamp": datetime.now().isoformat()
-        })
-        data["failed_patterns"] = data["failed_patterns"][-20:]
+    # O_APPEND keeps single-line writes atomic, no need to rewrite the file
+    fd = os.open(LEARNING_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(entry) + "\n").encode('utf-8'))
+    finally:
+        os.close(fd)
     
-    with open(LEARNING_FILE, 'wb') as f:
-        pickle.dump(data, f)
+    # Keep the cached patterns in sync instead of re-reading the file
+    if cache_valid:
+        key = "successful_patterns" if success else "failed_patterns"
+        _PATTERN_CACHE["data"][key].append(entry)
+        _PATTERN_CACHE["mtime"] = _learning_file_mtime()
+    
+    if os.path.getsize(LEARNING_FILE) > LEARNING_FILE_MAX_BYTES:
+        _trim_learning_file()
 
 def get_pattern_examples():
     """Get examples from successful patterns"""
     data = load_successful_patterns()
     if data["successful_patterns"]:
         # Return last 5 successful patterns as examples
-        examples = data["successful_patterns"][-5:]
+        examples = list(data["successful_patterns"])[-5:]
         return "\n\nEXAMPLES OF SUCCESSFUL PATTERNS:\n" + "\n---\n".join(
             [p["pattern"] for p in examples]
         )
     return ""
 
-def generate_slide_content(topic, num_slides=5):
+async def generate_slide_content(topic, num_slides=5):
     """Generate content for slides using GPT with structured JSON output"""
     prompt = f"""Create content for a {num_slides}-slide presentation about {topic}.
     
@@ -88,7 +180,7 @@ def generate_slide_content(topic, num_slides=5):
     
     Generate {num_slides} slides total. First slide must be type "title", rest are type "content"."""
     
-    response = client.chat.completions.create(
+    response = await client.chat.completions.create(
         model="gpt-4o",
         messages=[
             {"role": "system", "content": "You are a presentation content creator. Create clear, concise bullet points. Always respond with valid JSON only."},
@@ -100,35 +192,70 @@ def generate_slide_content(topic, num_slides=5):
     
     return response.choices[0].message.content
 
-def generate_mermaid_chart(slide_data, topic, max_retries=10):
-    """Generate a complex Mermaid chart with multiple arrows using iterative learning"""
+class Node(BaseModel):
+    model_config = ConfigDict(extra="forbid")
     
-    bullets = '\n'.join(slide_data.get('bullets', []))
+    id: str
+    label: str
+
+class Edge(BaseModel):
+    model_config = ConfigDict(extra="forbid")
     
-    pattern_examples = get_pattern_examples()
+    src: str
+    dst: str
+
+class MermaidGraph(BaseModel):
+    model_config = ConfigDict(extra="forbid")
     
-    prompt = f"""Create a Mermaid flowchart with MULTIPLE ARROWS and COMPLEX RELATIONSHIPS:
+    nodes: list[Node]
+    edges: list[Edge]
 
-Title: {slide_data.get('title')}
-Content: {bullets}
-
-CRITICAL SYNTAX RULES (FOLLOW EXACTLY):
-1. Start with EXACTLY: %%{{init: {{'theme':'forest'}}}}%%
-2. Second line MUST be: graph TD
-3. Node IDs: Use ONLY A, B, C, D, E, F, G, H (single letters)
-4. Node text: A[Text Here] - NO quotes, NO special chars in text
-5. Arrows: Use --> ONLY
-6. MULTIPLE ARROWS: Each node can connect to multiple nodes
-   Example: A --> B
-            A --> C
-            B --> D
-            C --> D
-7. Create 5-8 nodes with COMPLEX relationships
-8. NO subgraphs, NO styles, NO classes, NO special syntax
-9. Each line: one connection only
-
-GOOD COMPLEX EXAMPLE:
-%%{{init: {{'theme':'forest'}}}}%%
+class SlideArtifacts(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    
+    mermaid: MermaidGraph
+    narration: str
+
+# Brackets, quotes and pipes break Mermaid node text
+_LABEL_UNSAFE_RE = re.compile(r"[\[\]{}()<>\"'|#;]")
+
+def _clean_node_label(label):
+    return _LABEL_UNSAFE_RE.sub("", label).strip()
+
+def graph_to_mermaid(graph):
+    """Synthesize deterministic Mermaid source from a structured graph"""
+    # Model IDs may be Mermaid keywords (e.g. end), so nodes get generated IDs N1..Nk
+    node_ids = {}
+    labels = {}
+    for node in graph.nodes:
+        if node.id in node_ids:
+            continue
+        node_id = f"N{len(node_ids) + 1}"
+        node_ids[node.id] = node_id
+        labels[node_id] = _clean_node_label(node.label) or _clean_node_label(node.id) or node_id
+    
+    edges = [(node_ids[e.src], node_ids[e.dst]) for e in graph.edges if e.src in node_ids and e.dst in node_ids]
+    
+    # Quoted labels keep text like /Fin from being read as shape syntax, '"' is already stripped
+    lines = ["%%{init: {'theme':'forest'}}%%", "graph TD"]
+    lines += [f'    {node_id}["{label}"]' for node_id, label in labels.items()]
+    lines += [f"    {src} --> {dst}" for src, dst in edges]
+    return "\n".join(lines), len(edges)
+
+# Static instructions go first in the system message and only the slide content changes
+# in the user message. OpenAI only caches prefixes of 1024+ tokens, which these prompts
+# stay below today, but the layout keeps the prefix identical across a run if they grow.
+MERMAID_SYSTEM = """You are a Mermaid diagram expert. Create flowchart graphs with MULTIPLE ARROWS and COMPLEX RELATIONSHIPS for presentation slides.
+
+RULES:
+1. Node IDs: Use ONLY A, B, C, D, E, F, G, H (single letters)
+2. Node labels: short text, NO quotes, NO special chars
+3. Create 5-8 nodes with COMPLEX relationships
+4. MULTIPLE ARROWS: Each node can connect to multiple nodes, create at least 4 edges
+5. Every edge must reference existing node IDs
+
+The graph is rendered as a Mermaid flowchart like this:
+%%{init: {'theme':'forest'}}%%
 graph TD
     A[Start] --> B[Process 1]
     A --> C[Process 2]
@@ -138,182 +265,345 @@ graph TD
     C --> F[Result 3]
     D --> G[Conclusion]
     E --> G[Conclusion]
-    F --> G[Conclusion]
+    F --> G[Conclusion]"""
 
-BAD EXAMPLES TO AVOID:
-- Using quotes: A["Text"]
-- Special chars: A[Text!@#]
-- Multi-word IDs: Node1[Text]
-- Multiple arrows per line: A --> B --> C
-- Missing init line
-- Wrong arrow: A -> B or A => B
+# Pattern examples frozen at the start of a run, so slides saving patterns
+# concurrently don't change the system message between requests
+_frozen_pattern_examples = None
 
-{pattern_examples}
+def freeze_pattern_examples():
+    global _frozen_pattern_examples
+    _frozen_pattern_examples = get_pattern_examples()
 
-Create a COMPLEX chart with MULTIPLE ARROWS. Return ONLY the Mermaid code, nothing else."""
-    
-    for attempt in range(max_retries):
-        try:
-            print(f"  🔄 Attempt {attempt + 1}/{max_retries} to generate valid Mermaid chart...")
-            
-            response = client.chat.completions.create(
+def _run_pattern_examples():
+    if _frozen_pattern_examples is None:
+        return get_pattern_examples()
+    return _frozen_pattern_examples
+
+def _slide_content_prompt(slide_data):
+    bullets = '\n'.join(f"- {b}" for b in slide_data.get('bullets', []))
+    return f"""Slide Title: {slide_data.get('title')}
+Points:
+{bullets}"""
+
+def build_mermaid_messages(slide_data):
+    """Build the chat messages asking GPT for a slide's flowchart graph"""
+    return [
+        {"role": "system", "content": MERMAID_SYSTEM + _run_pattern_examples()},
+        {"role": "user", "content": f"Create the flowchart graph for this slide:\n\n{_slide_content_prompt(slide_data)}"}
+    ]
+
+def finalize_mermaid_graph(graph, log_prefix=""):
+    """Turn a parsed graph into Mermaid code"""
+    mermaid_code, arrow_count = graph_to_mermaid(graph)
+    if arrow_count < 4:
+        print(f"  {log_prefix}⚠️  Chart has only {arrow_count} arrows")
+    else:
+        print(f"  {log_prefix}✅ Complex Mermaid chart generated with {arrow_count} arrows")
+    return mermaid_code
+
+class MermaidRendererUnavailable(Exception):
+    """The chart renderer could not be reached, which says nothing about the Mermaid code"""
+
+async def generate_mermaid_chart(slide_data, topic, max_retries=2, max_attempts=2, initial_code=None, log_prefix=""):
+    """
+    Generate a complex Mermaid chart with multiple arrows using Structured Outputs.
+    The chart is validated by rendering it once, returns (mermaid_code, image_bytes).
+    MermaidRendererUnavailable propagates without touching the learning file.
+    """
+    mermaid_code = initial_code
+    for attempt in range(max_attempts):
+        if mermaid_code is None:
+            # The schema guarantees the shape, the client only retries transient errors
+            response = await client.with_options(max_retries=max_retries).chat.completions.parse(
                 model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are a Mermaid diagram expert. Create ONLY valid, complex flowcharts with multiple arrows. Follow syntax rules EXACTLY."},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=build_mermaid_messages(slide_data),
+                response_format=MermaidGraph,
                 temperature=0.2  # Low temperature for consistency
             )
             
-            mermaid_code = response.choices[0].message.content.strip()
-            
-            # Clean up markdown code blocks
-            if "```mermaid" in mermaid_code:
-                mermaid_code = mermaid_code.split("```mermaid")[1].split("```")[0].strip()
-            elif "```" in mermaid_code:
-                mermaid_code = mermaid_code.replace("```", "").strip()
-            
-            # Strict validation
-            lines = mermaid_code.split('\n')
-            
-            # Check init line
-            if not lines[0].strip().startswith("%%{init:"):
-                print(f"  ❌ Missing init line")
-                save_successful_pattern(mermaid_code, success=False)
-                continue
-            
-            # Check graph declaration
-            if "graph TD" not in lines[1] and "graph LR" not in lines[1]:
-                print(f"  ❌ Missing or incorrect graph declaration")
-                save_successful_pattern(mermaid_code, success=False)
-                continue
-            
-            # Validate arrows
-            arrow_count = mermaid_code.count('-->')
-            if arrow_count < 4:
-                print(f"  ❌ Not enough complexity ({arrow_count} arrows, need 4+)")
-                save_successful_pattern(mermaid_code, success=False)
-                continue
-            
-            # Check for bad patterns
-            if '["' in mermaid_code or "['" in mermaid_code:
-                print(f"  ❌ Contains quotes in brackets")
-                save_successful_pattern(mermaid_code, success=False)
-                continue
-            
-            # Test render
-            if validate_mermaid_syntax(mermaid_code):
-                print(f"  ✅ Valid complex Mermaid chart generated with {arrow_count} arrows")
-                save_successful_pattern(mermaid_code, success=True)
-                return mermaid_code
-            else:
-                print(f"  ❌ Syntax validation failed on render test")
-                save_successful_pattern(mermaid_code, success=False)
-                
-                # On later attempts, provide more specific feedback
-                if attempt >= 3:
-                    prompt += f"\n\nPREVIOUS ATTEMPT FAILED. Common issues:\n- Check all brackets are properly closed\n- Ensure no special characters\n- Verify arrow syntax (use --> only)\n- Make sure each connection is on its own line"
-                
-        except Exception as e:
-            print(f"  ❌ Error in attempt {attempt + 1}: {e}")
-            if attempt < max_retries - 1:
-                continue
+            graph = response.choices[0].message.parsed
+            if graph is None:
+                raise Exception(f"Model refused to generate Mermaid chart: {response.choices[0].message.refusal}")
+            mermaid_code = finalize_mermaid_graph(graph, log_prefix)
+        
+        image_bytes = await validate_mermaid_syntax(mermaid_code, log_prefix=log_prefix)
+        if image_bytes is not None:
+            save_successful_pattern(mermaid_code, success=True)
+            return mermaid_code, image_bytes
+        
+        print(f"  {log_prefix}❌ Chart failed to render (attempt {attempt + 1}/{max_attempts})")
+        save_successful_pattern(mermaid_code, success=False)
+        mermaid_code = None
     
-    # If all attempts fail, raise an error instead of using fallback
-    raise Exception(f"Failed to generate valid Mermaid chart after {max_retries} attempts. Check the learning file and try again.")
+    raise Exception(f"Failed to generate a renderable Mermaid chart after {max_attempts} attempts")
 
-def validate_mermaid_syntax(mermaid_code):
-    """Validate Mermaid syntax by attempting to render it"""
-    try:
-        import base64
-        encoded = base64.b64encode(mermaid_code.encode('utf-8')).decode('utf-8')
-        url = f"https://mermaid.ink/img/{encoded}"
-        response = requests.get(url, timeout=15)
+def _mermaid_cache_key(mermaid_code):
+    return hashlib.blake2b(mermaid_code.encode('utf-8')).hexdigest()
+
+def _load_cached_render(cache_key):
+    """Return rendered chart bytes from the in-process or on-disk cache, if present"""
+    if cache_key in _mermaid_render_cache:
+        return _mermaid_render_cache[cache_key]
+    cache_path = os.path.join(MERMAID_CACHE_DIR, f"{cache_key}.png")
+    if os.path.exists(cache_path):
+        with open(cache_path, 'rb') as f:
+            _mermaid_render_cache[cache_key] = f.read()
+        return _mermaid_render_cache[cache_key]
+    return None
+
+def _store_cached_render(cache_key, image_bytes):
+    _mermaid_render_cache[cache_key] = image_bytes
+    os.makedirs(MERMAID_CACHE_DIR, exist_ok=True)
+    with open(os.path.join(MERMAID_CACHE_DIR, f"{cache_key}.png"), 'wb') as f:
+        f.write(image_bytes)
+
+async def _render_mermaid_local(mermaid_code, log_prefix=""):
+    """
+    Render Mermaid code to PNG with the local mermaid-cli, returns None if mmdc failed.
+    A failure can be a syntax error or a broken install (e.g. missing Chromium), so
+    callers should not treat it as a rejection of the code.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = os.path.join(tmp_dir, "chart.png")
+        process = await asyncio.create_subprocess_exec(
+            MMDC_PATH, "-i", "-", "-o", output_path, "-b", "transparent",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(mermaid_code.encode('utf-8')), MMDC_TIMEOUT)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            print(f"  {log_prefix}❌ mmdc timed out after {MMDC_TIMEOUT}s")
+            return None
         
-        # Check if it's actually an image
-        if response.status_code == 200:
-            content_type = response.headers.get('content-type', '')
-            return 'image' in content_type and len(response.content) > 1000
-        return False
-    except:
-        return False
-
-def render_mermaid_to_image(mermaid_code, output_path, max_retries=3):
-    """Render Mermaid code to image using Mermaid.ink API"""
-    import base64
-    import time
+        if process.returncode != 0 or not os.path.exists(output_path):
+            print(f"  {log_prefix}❌ mmdc failed: {stderr.decode('utf-8', 'replace').strip()[:300]}")
+            return None
+        
+        with open(output_path, 'rb') as f:
+            return f.read()
+
+@functools.lru_cache(maxsize=64)
+def _encode_mermaid_for_url(mermaid_code):
+    """URL-safe base64 of the Mermaid source, standard base64 '+' and '/' can be mangled in the URL path"""
+    return base64.urlsafe_b64encode(mermaid_code.encode('utf-8')).decode('ascii').rstrip("=")
+
+async def _render_mermaid_remote(mermaid_code, max_retries=3, log_prefix=""):
+    """
+    Render Mermaid code with the Mermaid.ink API, returns None if it rejected the code.
+    Raises MermaidRendererUnavailable if it never answered with an image or a rejection.
+    """
+    url = f"https://mermaid.ink/img/{_encode_mermaid_for_url(mermaid_code)}"
     
     for attempt in range(max_retries):
         try:
-            clean_code = mermaid_code.strip()
-            encoded = base64.b64encode(clean_code.encode('utf-8')).decode('utf-8')
-            url = f"https://mermaid.ink/img/{encoded}"
-            
-            print(f"  📊 Rendering Mermaid chart to image (attempt {attempt + 1}/{max_retries})...")
-            response = requests.get(url, timeout=30)
+            print(f"  {log_prefix}📊 Rendering Mermaid chart to image (attempt {attempt + 1}/{max_retries})...")
+            response = await _get_http_client().get(url, timeout=30)
             
             if response.status_code == 200:
                 content_type = response.headers.get('content-type', '')
                 if 'image' in content_type:
-                    with open(output_path, 'wb') as f:
-                        f.write(response.content)
-                    print(f"  ✅ Mermaid chart rendered successfully")
-                    return True
+                    return response.content
                 else:
-                    print(f"  ⚠️  Response is not an image")
-                    time.sleep(2)
+                    print(f"  {log_prefix}⚠️  Response is not an image")
+                    await asyncio.sleep(2)
                     continue
+            elif 400 <= response.status_code < 500 and response.status_code != 429:
+                # Mermaid.ink answers client errors for code it cannot parse
+                print(f"  {log_prefix}❌ Mermaid.ink rejected the chart (HTTP {response.status_code})")
+                return None
             else:
-                print(f"  ❌ HTTP {response.status_code}")
-                time.sleep(2)
+                print(f"  {log_prefix}❌ HTTP {response.status_code}")
+                await asyncio.sleep(2)
                 
         except Exception as e:
-            print(f"  ❌ Render error: {e}")
+            print(f"  {log_prefix}❌ Render error: {e}")
             if attempt < max_retries - 1:
-                time.sleep(2)
+                await asyncio.sleep(2)
     
-    raise Exception("Failed to render Mermaid chart to image")
+    raise MermaidRendererUnavailable(f"Mermaid.ink did not return an image after {max_retries} attempts")
 
-def generate_narration_script(slide_data):
-    """Generate natural speech narration for a slide using GPT"""
+async def validate_mermaid_syntax(mermaid_code, max_retries=3, log_prefix=""):
+    """
+    Validate Mermaid syntax by rendering it, reusing cached renders.
+    Uses the local mermaid-cli (mmdc) when installed, the Mermaid.ink API otherwise or
+    when mmdc fails, so only Mermaid.ink decides that the code is invalid.
+    Returns the PNG bytes, or None if the renderer rejected the code.
+    Raises MermaidRendererUnavailable if the renderer could not be reached.
+    """
+    clean_code = mermaid_code.strip()
+    cache_key = _mermaid_cache_key(clean_code)
+    image_bytes = _load_cached_render(cache_key)
+    if image_bytes is not None:
+        print(f"  {log_prefix}✅ Mermaid chart loaded from cache")
+        return image_bytes
+    
+    if MMDC_PATH:
+        print(f"  {log_prefix}📊 Rendering Mermaid chart locally with mmdc...")
+        image_bytes = await _render_mermaid_local(clean_code, log_prefix)
+        if image_bytes is None:
+            print(f"  {log_prefix}↪️  Falling back to Mermaid.ink")
+    if image_bytes is None:
+        image_bytes = await _render_mermaid_remote(clean_code, max_retries, log_prefix)
+    
+    if image_bytes is not None:
+        _store_cached_render(cache_key, image_bytes)
+        print(f"  {log_prefix}✅ Mermaid chart rendered successfully")
+    return image_bytes
+
+NARRATION_SYSTEM = """You are a professional presenter. Create natural, engaging spoken narration.
+
+- Write as if you're presenting to an audience. Be clear and engaging.
+- Scripts should not be more than 30 seconds long.
+- For content slides, explain each point conversationally. Don't just read the bullets - explain them naturally.
+- Content slides are not the first slide: DO NOT start with Hello Everyone or welcome, talk like a continuation of the presentation."""
+
+def build_narration_messages(slide_data):
+    """Build the chat messages asking GPT for a slide's narration"""
     if slide_data.get('type') == 'title':
-        prompt = f"""Create a brief spoken introduction (2-3 sentences) for this presentation title slide. Script should not be more than 30 seconds long.
+        prompt = f"""Create a brief spoken introduction (2-3 sentences) for this presentation title slide. Keep it concise and welcoming.
 
-        Title: {slide_data.get('title')}
-        Subtitle: {slide_data.get('subtitle', '')}
-        
-        Write it as natural speech, as if presenting to an audience. Keep it concise and welcoming."""
+Title: {slide_data.get('title')}
+Subtitle: {slide_data.get('subtitle', '')}"""
     else:
-        bullets = '\n'.join(f"- {b}" for b in slide_data.get('bullets', []))
-        prompt = f"""Create natural spoken narration for this slide. Explain each point conversationally:
-        
-        Slide Title: {slide_data.get('title')}
-        Points:
-        {bullets}
-        DO NOT Start with Hello Everyone or welcome because this is not the first slide.
-        talk like a continuation of the presentation in the beginning.
-        Script should not be more than 30 seconds long.
-        Write as if you're presenting to an audience. Be clear and engaging. Don't just read the bullets - explain them naturally."""
-    
-    response = client.chat.completions.create(
+        prompt = f"Create spoken narration for this content slide:\n\n{_slide_content_prompt(slide_data)}"
+    
+    return [
+        {"role": "system", "content": NARRATION_SYSTEM},
+        {"role": "user", "content": prompt}
+    ]
+
+def build_slide_artifacts_messages(slide_data):
+    """Build the chat messages asking GPT for a content slide's narration and flowchart graph at once"""
+    return [
+        {"role": "system", "content": f"{NARRATION_SYSTEM}\n\n{MERMAID_SYSTEM}{_run_pattern_examples()}"},
+        {"role": "user", "content": f"Create the spoken narration and the flowchart graph for this content slide:\n\n{_slide_content_prompt(slide_data)}"}
+    ]
+
+async def generate_narration_script(slide_data):
+    """Generate natural speech narration for a slide using GPT"""
+    response = await client.chat.completions.create(
         model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are a professional presenter. Create natural, engaging spoken narration."},
-            {"role": "user", "content": prompt}
-        ],
+        messages=build_narration_messages(slide_data),
         temperature=0.7
     )
     
     return response.choices[0].message.content
 
-def generate_speech_elevenlabs(text, output_path, voice_id=None, api_key=None):
-    """Generate speech using ElevenLabs API and return audio duration in seconds"""
+async def generate_slide_artifacts(slide_data, max_retries=2, log_prefix=""):
+    """Generate a content slide's Mermaid chart and narration in a single GPT call, returns (mermaid_code, narration)"""
+    response = await client.with_options(max_retries=max_retries).chat.completions.parse(
+        model="gpt-4o",
+        messages=build_slide_artifacts_messages(slide_data),
+        response_format=SlideArtifacts,
+        temperature=0.5  # Between the chart (0.2) and narration (0.7) settings
+    )
+    
+    artifacts = response.choices[0].message.parsed
+    if artifacts is None:
+        raise Exception(f"Model refused to generate slide artifacts: {response.choices[0].message.refusal}")
+    
+    return finalize_mermaid_graph(artifacts.mermaid, log_prefix), artifacts.narration
+
+async def batch_generate_all(slides_data, poll_interval=BATCH_POLL_INTERVAL):
+    """
+    Generate every slide's Mermaid chart and narration in a single OpenAI Batch job,
+    one request per slide.
+    Batch requests are billed at half price; results usually arrive within minutes.
+    Returns {slide_idx: {"mermaid_code": ..., "narration": ...}}, missing keys mean
+    the request failed and should be retried live. A batch that does not complete
+    returns {} so every slide goes through the live path.
+    """
+    artifacts_format = {
+        "type": "json_schema",
+        "json_schema": {"name": "SlideArtifacts", "schema": SlideArtifacts.model_json_schema(), "strict": True}
+    }
+    
+    lines = []
+    for idx, slide_data in enumerate(slides_data, 1):
+        if slide_data.get('type') == 'title':
+            lines.append({
+                "custom_id": f"narration_{idx}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": "gpt-4o",
+                    "messages": build_narration_messages(slide_data),
+                    "temperature": 0.7
+                }
+            })
+        else:
+            lines.append({
+                "custom_id": f"slide_{idx}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": "gpt-4o",
+                    "messages": build_slide_artifacts_messages(slide_data),
+                    "response_format": artifacts_format,
+                    "temperature": 0.5
+                }
+            })
+    
+    jsonl = "".join(json.dumps(line) + "\n" for line in lines)
+    batch_file = await client.files.create(file=("presentation_batch.jsonl", jsonl.encode('utf-8')), purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    print(f"📦 Submitted batch {batch.id} with {len(lines)} requests")
+    
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(poll_interval)
+        batch = await client.batches.retrieve(batch.id)
+        print(f"  ⏳ Batch status: {batch.status}")
+    
+    if batch.status != "completed" or not batch.output_file_id:
+        print(f"  ⚠️  Batch {batch.id} ended with status {batch.status}, falling back to live calls")
+        return {}
+    
+    output = await client.files.content(batch.output_file_id)
+    
+    results = {}
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response") or {}
+        if response.get("status_code") != 200:
+            print(f"  ⚠️  Batch request {item['custom_id']} failed: {item.get('error')}")
+            continue
+        
+        kind, idx = item["custom_id"].rsplit("_", 1)
+        content = response["body"]["choices"][0]["message"]["content"]
+        slide_result = results.setdefault(int(idx), {})
+        try:
+            if kind == "slide":
+                artifacts = SlideArtifacts.model_validate_json(content)
+                slide_result["mermaid_code"] = finalize_mermaid_graph(artifacts.mermaid, f"[Slide {idx}] ")
+                slide_result["narration"] = artifacts.narration
+            else:
+                slide_result["narration"] = content
+        except Exception as e:
+            print(f"  ⚠️  Could not parse batch result {item['custom_id']}: {e}")
+    
+    print(f"✅ Batch {batch.id} completed")
+    return results
+
+async def generate_speech_elevenlabs(text, output_path, voice_id=None, api_key=None, log_prefix=""):
+    """Generate speech using ElevenLabs API and return audio duration in seconds, or None on failure"""
     if voice_id is None:
         voice_id = os.getenv("ELEVENLABS_VOICE_ID")
     if api_key is None:
         api_key = os.getenv("ELEVENLABS_API_KEY")
     
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+    # Streaming endpoint, audio chunks are written to disk as soon as they are synthesized
+    url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream"
     
     headers = {
         "Accept": "audio/mpeg",
@@ -330,57 +620,108 @@ def generate_speech_elevenlabs(text, output_path, voice_id=None, api_key=None):
         }
     }
     
-    print(f"  🎤 Generating speech...")
-    response = requests.post(url, json=data, headers=headers)
+    # Never leave narration from an earlier run behind if this request fails
+    if os.path.exists(output_path):
+        os.remove(output_path)
     
-    if response.status_code == 200:
-        with open(output_path, 'wb') as f:
-            f.write(response.content)
+    print(f"  {log_prefix}🎤 Generating speech...")
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        async with _get_http_client().stream("POST", url, json=data, headers=headers, timeout=60) as response:
+            if response.status_code == 200:
+                with open(output_path, 'wb') as f:
+                    async for chunk in response.aiter_bytes(8192):
+                        f.write(chunk)
+            else:
+                await response.aread()
         
-        audio = AudioSegment.from_mp3(output_path)
-        duration_seconds = len(audio) / 1000.0
+        if response.status_code not in HTTP_RETRY_STATUS_CODES or attempt == HTTP_MAX_RETRIES:
+            break
+        delay = _retry_delay(response, attempt)
+        print(f"  {log_prefix}⚠️  ElevenLabs returned HTTP {response.status_code}, retrying in {delay:.1f}s...")
+        await asyncio.sleep(delay)
+    
+    if response.status_code == 200:
+        # Reads only the MP3 headers, no need to decode the audio
+        duration_seconds = MP3(output_path).info.length
         
-        print(f"  ✅ Audio saved: {output_path} (Duration: {duration_seconds:.1f}s)")
+        print(f"  {log_prefix}✅ Audio saved: {output_path} (Duration: {duration_seconds:.1f}s)")
         return duration_seconds
     else:
-        print(f"  ❌ Error generating speech: {response.status_code}")
-        print(f"  Response: {response.text}")
-        return 5.0
+        print(f"  {log_prefix}❌ Error generating speech: {response.status_code}")
+        print(f"  {log_prefix}Response: {response.text}")
+        return None
+
+@functools.lru_cache(maxsize=None)
+def _load_font(path, size):
+    return ImageFont.truetype(path, size)
+
+@functools.lru_cache(maxsize=None)
+def _load_slide_fonts():
+    """Load the slide fonts once, falling back to Helvetica and then PIL's default font"""
+    sizes = {"title": 80, "subtitle": 40, "content_title": 60, "bullet": 35}
+    for font_path in ("Arial", "/System/Library/Fonts/Helvetica.ttc"):
+        try:
+            return {name: _load_font(font_path, size) for name, size in sizes.items()}
+        except OSError:
+            continue
+    return {name: ImageFont.load_default() for name in sizes}
+
+def _read_image_bgr(path):
+    """Read an image as uint8 BGR or BGRA, returns None if it cannot be read"""
+    import cv2
+    import numpy as np
+    
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        return None
+    if image.dtype != np.uint8:
+        image = (image / 257).astype(np.uint8)
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    return image
+
+@functools.lru_cache(maxsize=None)
+def _load_logo(path, height):
+    """Read and resize the logo once, returns None if it cannot be read"""
+    import cv2
+    
+    logo = _read_image_bgr(path)
+    if logo is None:
+        return None
+    width = int(height * logo.shape[1] / logo.shape[0])
+    return cv2.resize(logo, (width, height), interpolation=cv2.INTER_LANCZOS4)
+
+def _overlay_image(canvas, overlay, x, y):
+    """Paste overlay onto canvas at (x, y), alpha blending when it has an alpha channel"""
+    import numpy as np
+    
+    h = min(overlay.shape[0], canvas.shape[0] - y)
+    w = min(overlay.shape[1], canvas.shape[1] - x)
+    if h <= 0 or w <= 0:
+        return
+    overlay = overlay[:h, :w]
+    region = canvas[y:y + h, x:x + w]
+    if overlay.shape[2] == 4:
+        alpha = overlay[..., 3:4].astype(np.float32) / 255.0
+        region[:] = (overlay[..., :3] * alpha + region * (1.0 - alpha)).astype(np.uint8)
+    else:
+        region[:] = overlay
 
 def create_slide_image(slide_data, logo_path, output_path, mermaid_image_path=None, 
-                      width=1920, height=1080):
-    """Create a slide image using PIL with LARGER Mermaid chart"""
+                      width=1920, height=1080, log_prefix=""):
+    """Create a slide image with LARGER Mermaid chart, text via PIL and compositing via OpenCV"""
+    # OpenCV/NumPy are only needed here, which runs in the slide rendering worker processes
+    import cv2
+    import numpy as np
+    
     img = Image.new('RGB', (width, height), color='white')
     draw = ImageDraw.Draw(img)
     
-    # Load logo
-    try:
-        logo = Image.open(logo_path)
-        logo_height = 80
-        aspect = logo.width / logo.height
-        logo_width = int(logo_height * aspect)
-        logo = logo.resize((logo_width, logo_height), Image.Resampling.LANCZOS)
-        img.paste(logo, (50, height - logo_height - 50), logo if logo.mode == 'RGBA' else None)
-    except Exception as e:
-        print(f"  ⚠️  Could not load logo: {e}")
-    
-    # Load fonts
-    try:
-        title_font = ImageFont.truetype("Arial", 80)
-        subtitle_font = ImageFont.truetype("Arial", 40)
-        content_title_font = ImageFont.truetype("Arial", 60)
-        bullet_font = ImageFont.truetype("Arial", 35)
-    except:
-        try:
-            title_font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 80)
-            subtitle_font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 40)
-            content_title_font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 60)
-            bullet_font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 35)
-        except:
-            title_font = ImageFont.load_default()
-            subtitle_font = ImageFont.load_default()
-            content_title_font = ImageFont.load_default()
-            bullet_font = ImageFont.load_default()
+    fonts = _load_slide_fonts()
+    title_font = fonts["title"]
+    subtitle_font = fonts["subtitle"]
+    content_title_font = fonts["content_title"]
+    bullet_font = fonts["bullet"]
     
     if slide_data.get('type') == 'title':
         # Title slide - NO CHART
@@ -409,21 +750,25 @@ def create_slide_image(slide_data, logo_path, output_path, mermaid_image_path=No
         y_position = 250
         max_bullet_width = 800  # Reduced from default to make room for chart
         
+        space_width = bullet_font.getlength(' ')
+        
         for bullet in bullets:
             words = bullet.split()
             lines = []
-            current_line = []
-            
-            for word in words:
-                current_line.append(word)
-                test_line = ' '.join(current_line)
-                bbox = draw.textbbox((0, 0), test_line, font=bullet_font)
-                if bbox[2] - bbox[0] > max_bullet_width:
-                    current_line.pop()
-                    lines.append(' '.join(current_line))
-                    current_line = [word]
             
-            if current_line:
+            # Measure each word once and wrap by summing widths
+            if words:
+                widths = [bullet_font.getlength(word) for word in words]
+                current_line = [words[0]]
+                current_width = widths[0]
+                for word, word_width in zip(words[1:], widths[1:]):
+                    if current_width + space_width + word_width > max_bullet_width:
+                        lines.append(' '.join(current_line))
+                        current_line = [word]
+                        current_width = word_width
+                    else:
+                        current_line.append(word)
+                        current_width += space_width + word_width
                 lines.append(' '.join(current_line))
             
             draw.ellipse([150, y_position + 10, 165, y_position + 25], fill=(31, 73, 125))
@@ -434,18 +779,33 @@ def create_slide_image(slide_data, logo_path, output_path, mermaid_image_path=No
             
             y_position += 20
     
+    canvas = cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+    
+    # Load logo
+    try:
+        logo_height = 80
+        logo = _load_logo(logo_path, logo_height)
+        if logo is None:
+            raise ValueError(f"cannot read {logo_path}")
+        _overlay_image(canvas, logo, 50, height - logo_height - 50)
+    except Exception as e:
+        print(f"  {log_prefix}⚠️  Could not load logo: {e}")
+    
     # Add LARGER Mermaid chart for content slides
     if mermaid_image_path and os.path.exists(mermaid_image_path):
         try:
-            mermaid_img = Image.open(mermaid_image_path)
+            mermaid_img = _read_image_bgr(mermaid_image_path)
+            if mermaid_img is None:
+                raise ValueError(f"cannot read {mermaid_image_path}")
             
             # MUCH LARGER chart dimensions
             max_chart_width = 800  # Increased from 500
             max_chart_height = 600  # Increased from 350
             
-            aspect = mermaid_img.width / mermaid_img.height
+            chart_height, chart_width = mermaid_img.shape[:2]
+            aspect = chart_width / chart_height
             
-            if mermaid_img.width > max_chart_width or mermaid_img.height > max_chart_height:
+            if chart_width > max_chart_width or chart_height > max_chart_height:
                 if aspect > 1:
                     new_width = max_chart_width
                     new_height = int(new_width / aspect)
@@ -453,36 +813,164 @@ def create_slide_image(slide_data, logo_path, output_path, mermaid_image_path=No
                     new_height = max_chart_height
                     new_width = int(new_height * aspect)
                 
-                mermaid_img = mermaid_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+                mermaid_img = cv2.resize(mermaid_img, (new_width, new_height), interpolation=cv2.INTER_LANCZOS4)
+                chart_height, chart_width = mermaid_img.shape[:2]
             
             # Position in right side with padding
-            chart_x = width - mermaid_img.width - 50
-            chart_y = (height - mermaid_img.height) // 2  # Centered vertically
+            chart_x = width - chart_width - 50
+            chart_y = (height - chart_height) // 2  # Centered vertically
             
-            if mermaid_img.mode == 'RGBA':
-                img.paste(mermaid_img, (chart_x, chart_y), mermaid_img)
-            else:
-                img.paste(mermaid_img, (chart_x, chart_y))
-                
-            print(f"  📊 LARGE Mermaid chart added to slide ({mermaid_img.width}x{mermaid_img.height})")
+            _overlay_image(canvas, mermaid_img, chart_x, chart_y)
+            print(f"  {log_prefix}📊 LARGE Mermaid chart added to slide ({chart_width}x{chart_height})")
         except Exception as e:
-            print(f"  ⚠️  Could not add Mermaid chart to slide: {e}")
+            print(f"  {log_prefix}⚠️  Could not add Mermaid chart to slide: {e}")
     
-    img.save(output_path)
-    print(f"  🖼️  Slide image saved: {output_path}")
+    cv2.imwrite(output_path, canvas)
+    print(f"  {log_prefix}🖼️  Slide image saved: {output_path}")
 
 def parse_gpt_content(content):
     """Parse GPT JSON response into structured slide data"""
     data = json.loads(content)
     return data['slides']
 
-def generate_video_presentation(topic, logo_path="logo.png", output_filename=None, 
-                                audio_dir="audio", slides_dir="slides", charts_dir="charts"):
+async def process_slide(idx, total_slides, slide_data, topic, semaphore, pool, logo_path, audio_dir, slides_dir,
+                        charts_dir, batch_result=None):
+    """
+    Generate chart, narration, audio and slide image for a single slide.
+    GPT output already produced by batch_generate_all is reused when available,
+    otherwise chart and narration come from one generate_slide_artifacts call.
+    """
+    batch_result = batch_result or {}
+    # Slides run concurrently, so every log line names its slide
+    log_prefix = f"[Slide {idx}/{total_slides}] "
+    async with semaphore:
+        print(f"\n📄 Processing Slide {idx}/{total_slides}")
+        
+        mermaid_code = batch_result.get("mermaid_code")
+        narration_text = batch_result.get("narration")
+        if slide_data.get('type') != 'title' and mermaid_code is None and narration_text is None:
+            # One GPT call for both chart and narration, falls back to separate calls on failure
+            print(f"  {log_prefix}📝 Generating chart and narration script...")
+            try:
+                mermaid_code, narration_text = await generate_slide_artifacts(slide_data, log_prefix=log_prefix)
+            except Exception as e:
+                print(f"  {log_prefix}⚠️  Combined generation failed: {e}")
+        
+        async def build_chart():
+            # Only generate Mermaid chart for CONTENT slides (not title)
+            if slide_data.get('type') == 'title':
+                print(f"  {log_prefix}ℹ️  Title slide - no chart needed")
+                return None
+            print(f"  {log_prefix}📊 Generating complex Mermaid chart with multiple arrows...")
+            try:
+                _, image_bytes = await generate_mermaid_chart(
+                    slide_data, topic, initial_code=mermaid_code, log_prefix=log_prefix
+                )
+                mermaid_image_path = os.path.join(charts_dir, f"chart_{idx:02d}.png")
+                with open(mermaid_image_path, 'wb') as f:
+                    f.write(image_bytes)
+                return mermaid_image_path
+            except Exception as e:
+                print(f"  {log_prefix}⚠️  Skipping chart: {e}")
+                return None
+        
+        async def build_audio():
+            text = narration_text
+            if text is None:
+                print(f"  {log_prefix}📝 Generating narration script...")
+                text = await generate_narration_script(slide_data)
+            print(f"  {log_prefix}Script: {text[:100]}...")
+            audio_filename = os.path.join(audio_dir, f"slide_{idx:02d}.mp3")
+            duration = await generate_speech_elevenlabs(text, audio_filename, log_prefix=log_prefix)
+            if duration is None:
+                # No audio for this slide, it is shown for 5 seconds with silence
+                return None, 5.0
+            return audio_filename, duration
+        
+        # Chart rendering and speech synthesis are independent, so run them side by side
+        mermaid_image_path, (audio_filename, duration) = await asyncio.gather(build_chart(), build_audio())
+        
+        # Create slide image in a worker process, PIL holds the GIL while drawing
+        slide_image_path = os.path.join(slides_dir, f"slide_{idx:02d}.png")
+        await asyncio.get_running_loop().run_in_executor(
+            pool, functools.partial(create_slide_image, slide_data, logo_path, slide_image_path, mermaid_image_path,
+                                    log_prefix=log_prefix)
+        )
+        
+        print(f"  {log_prefix}✅ Slide ready (Duration: {duration:.1f}s)")
+        return slide_image_path, audio_filename, duration
+
+async def encode_slide_segment(slide_image_path, audio_filename, duration, segment_path, semaphore):
+    """
+    Encode a still slide and its narration into an H.264/AAC segment with ffmpeg.
+    audio_filename is None when speech generation failed.
+    """
+    if audio_filename is not None:
+        audio_input = ["-i", audio_filename]
+    else:
+        # Speech generation failed, keep the slide on screen with silence
+        audio_input = ["-f", "lavfi", "-t", f"{duration:.3f}", "-i", "anullsrc=r=44100:cl=stereo"]
+    
+    async with semaphore:
+        process = await asyncio.create_subprocess_exec(
+            FFMPEG_PATH, "-y", "-loglevel", "error",
+            "-loop", "1", "-framerate", str(VIDEO_FPS), "-t", f"{duration:.3f}", "-i", slide_image_path,
+            *audio_input,
+            "-c:v", "libx264", *X264_OPTIONS, "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-ar", "44100", "-ac", "2",
+            "-shortest", segment_path,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+    
+    if process.returncode != 0:
+        raise Exception(f"ffmpeg failed to encode {slide_image_path}: {stderr.decode('utf-8', 'replace').strip()}")
+
+async def assemble_video(slide_assets, output_filename):
+    """
+    Encode every slide into its own segment in parallel, then stream-copy
+    the segments into the final video with ffmpeg's concat demuxer.
+    """
+    semaphore = asyncio.Semaphore(os.cpu_count() or 1)
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        segment_paths = [os.path.join(tmp_dir, f"seg_{idx:02d}.mp4") for idx in range(1, len(slide_assets) + 1)]
+        await asyncio.gather(*[
+            encode_slide_segment(slide_image_path, audio_filename, duration, segment_path, semaphore)
+            for (slide_image_path, audio_filename, duration), segment_path in zip(slide_assets, segment_paths)
+        ])
+        
+        concat_path = os.path.join(tmp_dir, "concat.txt")
+        with open(concat_path, 'w', encoding='utf-8') as f:
+            for segment_path in segment_paths:
+                escaped_path = segment_path.replace("'", "'\\''")
+                f.write(f"file '{escaped_path}'\n")
+        
+        print(f"💾 Rendering final video...")
+        process = await asyncio.create_subprocess_exec(
+            FFMPEG_PATH, "-y", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", concat_path,
+            "-c", "copy", "-movflags", "+faststart", output_filename,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+    
+    if process.returncode != 0:
+        raise Exception(f"ffmpeg failed to concatenate segments: {stderr.decode('utf-8', 'replace').strip()}")
+
+async def generate_video_presentation(topic, logo_path="logo.png", output_filename=None, 
+                                      audio_dir="audio", slides_dir="slides", charts_dir="charts",
+                                      use_batch=False):
     """
     Generate complete video presentation with narration and dynamic Mermaid charts.
     - NO chart on title slide
     - Complex charts with multiple arrows on content slides
-    - Iterative learning to fix syntax errors
+    - Charts come from a structured graph, so no syntax retries are needed
+    - All slides are processed concurrently
+    - use_batch=True sends chart and narration prompts through the Batch API
+      (half the token cost, but may take minutes to complete)
     """
     os.makedirs(audio_dir, exist_ok=True)
     os.makedirs(slides_dir, exist_ok=True)
@@ -495,68 +983,45 @@ def generate_video_presentation(topic, logo_path="logo.png", output_filename=Non
     
     print(f"🎨 Generating presentation about: {topic}")
     print("⏳ Creating content with GPT...")
-    content = generate_slide_content(topic)
+    content = await generate_slide_content(topic)
     
     print("📝 Parsing structured content...")
     slides_data = parse_gpt_content(content)
     print(f"✅ Generated {len(slides_data)} slides")
     
-    video_clips = []
+    freeze_pattern_examples()
     
-    for idx, slide_data in enumerate(slides_data, 1):
-        print(f"\n📄 Processing Slide {idx}/{len(slides_data)}")
-        
-        mermaid_image_path = None
-        
-        # Only generate Mermaid chart for CONTENT slides (not title)
-        if slide_data.get('type') != 'title':
-            print(f"  📊 Generating complex Mermaid chart with multiple arrows...")
+    batch_results = {}
+    if use_batch:
+        print("📦 Generating charts and narration with the Batch API...")
+        try:
+            batch_results = await batch_generate_all(slides_data)
+        except Exception as e:
+            print(f"  ⚠️  Batch generation failed, falling back to live calls: {e}")
+    
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SLIDES)
+    try:
+        # Only MAX_CONCURRENT_SLIDES renders can run at once, don't fork/spawn idle workers
+        max_workers = min(len(slides_data), MAX_CONCURRENT_SLIDES, os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max(max_workers, 1)) as pool:
+            tasks = [
+                asyncio.create_task(process_slide(idx, len(slides_data), slide_data, topic, semaphore, pool, logo_path,
+                                                  audio_dir, slides_dir, charts_dir, batch_results.get(idx)))
+                for idx, slide_data in enumerate(slides_data, 1)
+            ]
             try:
-                mermaid_code = generate_mermaid_chart(slide_data, topic)
-                mermaid_image_path = os.path.join(charts_dir, f"chart_{idx:02d}.png")
-                render_mermaid_to_image(mermaid_code, mermaid_image_path)
-            except Exception as e:
-                print(f"  ⚠️  Skipping chart for this slide: {e}")
-                mermaid_image_path = None
-        else:
-            print(f"  ℹ️  Title slide - no chart needed")
-        
-        print(f"  📝 Generating narration script...")
-        narration_text = generate_narration_script(slide_data)
-        print(f"  Script: {narration_text[:100]}...")
-        
-        # Generate speech
-        audio_filename = os.path.join(audio_dir, f"slide_{idx:02d}.mp3")
-        duration = generate_speech_elevenlabs(narration_text, audio_filename)
-        
-        # Create slide image
-        slide_image_path = os.path.join(slides_dir, f"slide_{idx:02d}.png")
-        create_slide_image(slide_data, logo_path, slide_image_path, mermaid_image_path)
-        
-        # Create video clip
-        image_clip = ImageClip(slide_image_path).set_duration(duration)
-        audio_clip = AudioFileClip(audio_filename)
-        video_clip = image_clip.set_audio(audio_clip)
-        
-        video_clips.append(video_clip)
-        print(f"  ✅ Video clip created (Duration: {duration:.1f}s)")
-    
-    print(f"\n🎬 Combining all slides into final video...")
-    final_video = concatenate_videoclips(video_clips, method="compose")
-    
-    print(f"💾 Rendering final video...")
-    final_video.write_videofile(
-        output_filename,
-        fps=24,
-        codec='libx264',
-        audio_codec='aac',
-        temp_audiofile='temp-audio.m4a',
-        remove_temp=True
-    )
+                slide_assets = await asyncio.gather(*tasks)
+            except BaseException:
+                # Stop the remaining slides before the shared HTTP client is closed under them
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+    finally:
+        await _close_http_client()
     
-    final_video.close()
-    for clip in video_clips:
-        clip.close()
+    print(f"\n🎬 Encoding slides and combining into final video...")
+    await assemble_video(slide_assets, output_filename)
     
     print(f"\n✨ Video presentation saved as: {output_filename}")
     print(f" Audio files: {audio_dir}/")
@@ -568,4 +1033,4 @@ def generate_video_presentation(topic, logo_path="logo.png", output_filename=Non
     return output_filename
 
 if __name__ == "__main__":
-    generate_video_presentation("Python Tuples and Their Applications")
\ No newline at end of file
+    asyncio.run(generate_video_presentation("Python Tuples and Their Applications"))
\ No newline at end of file